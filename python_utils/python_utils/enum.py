@@ -7,6 +7,7 @@ class IntEnum(db.TypeDecorator):
     The default would have stored the enum's *name* (ie the string).
     """
     impl = db.Integer
+    cache_ok = True
 
     def __init__(self, enumtype, *args, **kwargs):
         super(IntEnum, self).__init__(*args, **kwargs)
@@ -1,10 +1,13 @@
 from datetime import datetime
+import functools
 import json
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, func
-from sqlalchemy.ext.declarative import as_declarative, DeclarativeMeta, declared_attr
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, func, and_, bindparam, select, inspect, literal
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.declarative import as_declarative, DeclarativeMeta, declared_attr, has_inherited_table
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import make_transient
+from sqlalchemy.orm.attributes import set_committed_value, flag_modified
 from python_utils.config import get_config
 from python_utils.logger import logger_console as logger
 import traceback
@@ -17,23 +20,195 @@ db = SQLAlchemy(session_options={
 })
 
 
+_pd = None
+_oj = None
+
+
+def _pandas():
+    """
+    Import pandas on first use, it is only needed to render registered parameters
+    :return: the pandas module
+    """
+    global _pd
+    if _pd is None:
+        import pandas as _pd
+    return _pd
+
+
+def _orjson():
+    """
+    Import orjson on first use, it is only needed to serialize models to json bytes
+    :return: the orjson module, or False when it is not installed
+    """
+    global _oj
+    if _oj is None:
+        try:
+            import orjson as _oj
+        except ImportError:
+            _oj = False
+    return _oj
+
+
 class JsonDeSerMixin(object):
+    __slots__ = ()
+    bulk_batch_size = 1000
+
+    @classmethod
+    def _col_keys(cls):
+        """
+        Get the mapped column keys, computed once per class
+        :return: tuple of column keys
+        """
+        keys = cls.__dict__.get('_col_keys_cache')
+        if keys is None:
+            keys = tuple(cls.__mapper__.c.keys())
+            cls._col_keys_cache = keys
+        return keys
+
     def to_json(self):
         result = dict()
-        for key in self.__mapper__.c.keys():
+        for key in self._col_keys():
             col = getattr(self, key)
             if isinstance(col, datetime):
                 col = col.isoformat()
             result[key] = col
         return result
 
+    def to_json_bytes(self):
+        """
+        Serialize the columns straight to json bytes with orjson, which encodes datetimes itself, in the same
+        isoformat as to_json. Falls back to json.dumps of to_json when orjson is not installed.
+        :return: bytes
+        """
+        orjson = _orjson()
+        if not orjson:
+            return json.dumps(self.to_json()).encode()
+        return orjson.dumps({key: getattr(self, key) for key in self._col_keys()})
+
+    @classmethod
+    def bulk_to_json_bytes(cls, objs):
+        """
+        Serialize a list of objects to a json array in a single orjson call, or json.dumps when orjson is not
+        installed
+        :param objs: the objects to serialize
+        :type objs: list
+        :return: bytes
+        """
+        orjson = _orjson()
+        if not orjson:
+            return json.dumps([o.to_json() for o in objs]).encode()
+        return orjson.dumps([{key: getattr(o, key) for key in o._col_keys()} for o in objs])
+
     def from_json(self, json_obj):
-        for k, v in json_obj.items():
-            setattr(self, k, v)
+        """
+        Upsert this object with the values of a json object. A new row is inserted from the object's loaded column
+        state with the json values on top, so values set by the constructor or the caller are kept. An existing row
+        only gets the keys of the json object, and changed_on is stamped for audited models. Pending objects,
+        classes with insert or update listeners and non-mysql binds go through session.merge instead.
+        :param json_obj: values keyed by column name
+        :type json_obj: dict
+        :return: True when committed
+        """
+        state = inspect(self)
+        if state.pending or not self._can_upsert():
+            for k, v in json_obj.items():
+                setattr(self, k, v)
+
+            db.session.merge(self)
+            error = db.session.commit()
+            return not error
+
+        columns = self._col_keys()
+        audit_columns = self._audit_columns()
+        supplied = [k for k in json_obj if k in columns]
+        row = {k: v for k, v in state.dict.items() if k in columns and k not in audit_columns}
+        row.update((k, json_obj[k]) for k in supplied)
+        self._upsert_json([row], supplied)
+        for k, v in row.items():
+            if isinstance(v, (dict, list)):
+                # assign containers so mutable types such as MutableDict coerce and track them, then drop the history
+                setattr(self, k, v)
+                v = state.dict[k]
+            set_committed_value(self, k, v)
+        if isinstance(self, LazyMixin):
+            self.invalidate()
+        db.session.commit()
+        return True
+
+    @classmethod
+    def bulk_from_json(cls, rows):
+        """
+        Upsert json objects with INSERT ... ON DUPLICATE KEY UPDATE, one statement per batch of rows instead of a
+        merge and a commit per object. Rows are grouped by the columns they carry, and only those columns are
+        updated on a duplicate key. Classes with insert or update listeners and non-mysql binds are loaded by id and
+        written through the session instead, so their listeners still run.
+        :param rows: json objects keyed by column name
+        :type rows: list
+        :return: True when committed
+        """
+        if cls._can_upsert():
+            cls._upsert_json(rows)
+        else:
+            columns = cls._col_keys()
+            for row in rows:
+                obj = db.session.query(cls).get(row['id']) if row.get('id') is not None else None
+                if obj is None:
+                    obj = cls()
+                    db.session.add(obj)
+                for k, v in row.items():
+                    if k in columns:
+                        setattr(obj, k, v)
+        db.session.commit()
+        return True
+
+    @classmethod
+    def _can_upsert(cls):
+        """
+        Whether rows of this class can be written with a mysql upsert. The upsert bypasses the unit of work, so it
+        is only used on mysql binds and for mappers without insert or update listeners.
+        :return: bool
+        """
+        dispatch = cls.__mapper__.dispatch
+        if dispatch.before_insert or dispatch.before_update or dispatch.after_insert or dispatch.after_update:
+            return False
+        return db.session.get_bind(mapper=cls.__mapper__).dialect.name == 'mysql'
 
-        db.session.merge(self)
-        error = db.session.commit()
-        return not error
+    @classmethod
+    def _audit_columns(cls):
+        return ('created_on', 'changed_on') if issubclass(cls, AuditMixin) else ()
+
+    @classmethod
+    def _upsert_json(cls, rows, update_keys=None):
+        """
+        Execute the upserts of bulk_from_json without committing. For a polymorphic class, rows without a
+        discriminator are inserted with the class's polymorphic identity, which does not overwrite the discriminator
+        of an existing row. Audited models get changed_on stamped on a duplicate key.
+        :param rows: json objects keyed by column name
+        :type rows: list
+        :param update_keys: the columns to update on a duplicate key, the keys of each row by default
+        :type update_keys: list
+        """
+        mapper = cls.__mapper__
+        discriminator = None
+        if mapper.polymorphic_on is not None:
+            discriminator = mapper.get_property_by_column(mapper.polymorphic_on).key
+        columns = set(cls._col_keys())
+        groups = {}
+        for row in rows:
+            row = {k: v for k, v in row.items() if k in columns}
+            keys = tuple(sorted(row if update_keys is None else update_keys))
+            if discriminator is not None and not row.get(discriminator):
+                row[discriminator] = mapper.polymorphic_identity
+            groups.setdefault((tuple(sorted(row)), keys), []).append(row)
+
+        stamp_changed_on = 'changed_on' in cls._audit_columns()
+        for (_, keys), group in groups.items():
+            for i in range(0, len(group), cls.bulk_batch_size):
+                stmt = mysql_insert(cls.__table__).values(group[i:i + cls.bulk_batch_size])
+                updates = {k: stmt.inserted[k] for k in keys if k != 'id'}
+                if stamp_changed_on:
+                    updates['changed_on'] = func.now()
+                db.session.execute(stmt.on_duplicate_key_update(updates or {'id': stmt.inserted['id']}))
 
 
 class AuditMixin(object):
@@ -45,6 +220,8 @@ class AuditMixin(object):
         :created on:
         :changed on:
     """
+    __slots__ = ()
+
     @declared_attr
     def created_on(self):
         return Column(DateTime, default=datetime.now, nullable=False)
@@ -56,37 +233,68 @@ class AuditMixin(object):
 
 
 def lazy_property(f):
-    internal_property = '__lazy_' + f.__name__
-
     @property
     def lazy_property_wrapper(self):
         try:
-            return getattr(self, internal_property)
+            cache = self._lazy_cache
         except AttributeError:
-            v = f(self)
-            setattr(self, internal_property, v)
-            return v
-        except Exception as e:
-            raise e
+            cache = self._lazy_cache = {}
+        if f.__name__ not in cache:
+            cache[f.__name__] = f(self)
+        return cache[f.__name__]
     return lazy_property_wrapper
 
 class LazyMixin(object):
+    __slots__ = ('_lazy_cache',)
+
     def invalidate(self, property_name=None):
         """
-        Invalidate a lazy property or all lazy properties in the object. If the lazy property does not exist,
-        raise AttributeError.
+        Invalidate a lazy property or all lazy properties in the object. Invalidating a lazy property that has not
+        been computed yet is a no-op.
         :param property_name: a lazy property
         :type property_name: str
-        :raise: AttributeError
         """
+        cache = getattr(self, '_lazy_cache', None)
+        if cache is None:
+            return
         if property_name is None:
-            lazy_properties = (name for name in dir(self) if name.startswith('__lazy_'))
-            for p in lazy_properties:
-                delattr(self, p)
+            cache.clear()
         else:
-            lazy_property_name = '__lazy_' + property_name
-            if hasattr(self, lazy_property_name):
-                delattr(self, lazy_property_name)
+            cache.pop(property_name, None)
+
+
+def _parent_parameters(cls):
+    """
+    Collect the parameters registered on the parent classes of cls, keeping the first definition of each name
+    :param cls: the parametrized class
+    :return: list of registered parameters
+    """
+    seen_fields = set()
+    seen = set()
+    parent_params = []
+    for klass in cls.__mro__:
+        for field, p_params in klass.__dict__.items():
+            if not field.startswith(register_parameter.PARAMETER_REGISTRY) or field in seen_fields:
+                continue
+            seen_fields.add(field)
+            for p in p_params:
+                if p['name'] not in seen:
+                    seen.add(p['name'])
+                    parent_params.append(p)
+    return parent_params
+
+
+@functools.lru_cache(maxsize=None)
+def _registered_parameters(cls):
+    field = '{}{}'.format(register_parameter.PARAMETER_REGISTRY, cls.__name__)
+    if not hasattr(cls, field):
+        setattr(cls, field, _parent_parameters(cls))
+    return getattr(cls, field)
+
+
+@functools.lru_cache(maxsize=None)
+def _parameter_index(cls):
+    return {p['name']: p for p in _registered_parameters(cls)}
 
 
 class register_parameter(object):
@@ -112,18 +320,8 @@ class register_parameter(object):
         field = '{}{}'.format(self.PARAMETER_REGISTRY, tcls.__name__)
 
         if not hasattr(tcls, field):
-            # TODO:  decide whether should use dir(cls) or dir(tcls)
-            parent_fields = [field for field in dir(cls) if field.startswith(register_parameter.PARAMETER_REGISTRY)]
-            parent_param_names = set()
-            parent_params = []
-            for f in parent_fields:
-                p_params=getattr(cls, f)
-                # use append then sum should be faster if the loop is deep.  Otherwise, extend should be fast.
-                parent_params.append([p for p in p_params if p['name'] not in parent_param_names])
-                parent_param_names|={p['name'] for p in p_params}
-            parent_params=sum(parent_params, [])
-
-            setattr(tcls, field, parent_params)
+            # TODO:  decide whether should walk cls or tcls
+            setattr(tcls, field, _parent_parameters(cls))
         params = getattr(tcls, field)
         found = [p for p in params if p['name'] == self.name]
         if found:
@@ -137,41 +335,34 @@ class register_parameter(object):
                        'type': self.parameter_type,
                        'description': self.description,
                        'cls': tcls.__name__})
+        _registered_parameters.cache_clear()
+        _parameter_index.cache_clear()
+        ParametrizedMixin._df_cache.pop(tcls.__name__, None)
+        ParametrizedMixin._markup_cache.pop(tcls.__name__, None)
         return cls
 
 
 class ParametrizedMixin(LazyMixin):
+    # registered parameter renderings, keyed by class name
+    _df_cache = {}
+    _markup_cache = {}
+
     # requires mysql 5.7
     @declared_attr
     def params(self):
         return Column(MutableDict.as_mutable(JSON), default={})
 
-    def __init__(self, params={}):
-        self.params = params
+    def __init__(self, params=None):
+        self.params = dict(params) if params else {}
 
     @lazy_property
     def parameters(self):
-        if not self.params or self.params == JSON.NULL:
-            return {}
-
-        try:
-            return self.params
-        except:
-            msg = 'Parameters {} can not be parsed as json'.format(self.params)
-            logger.error(msg)
-            logger.debug(traceback.format_exc())
-            raise ValueError(msg)
+        params = self.params
+        return params if params and params is not JSON.NULL else {}
 
     @classmethod
     def registered_parameters(cls):
-        field = '{}{}'.format(register_parameter.PARAMETER_REGISTRY, cls.__name__)
-        if not hasattr(cls, field):
-            parent_fields = [field for field in dir(cls) if field.startswith(register_parameter.PARAMETER_REGISTRY)]
-            parent_param_names = set()
-            parent_params = sum([[p for p in getattr(cls, f) if p['name'] not in parent_param_names]
-                                for f in parent_fields], [])
-            setattr(cls, field, parent_params)
-        return getattr(cls, field)
+        return _registered_parameters(cls)
 
     @classmethod
     def parameter_default(cls, name):
@@ -181,10 +372,7 @@ class ParametrizedMixin(LazyMixin):
         :type name: str
         :return: the default value registered
         """
-        for p in cls.registered_parameters():
-            if p['name'] == name:
-                return p['default']
-        return None
+        return _parameter_index(cls).get(name, {}).get('default')
 
     @classmethod
     def parameter_type(cls, name):
@@ -194,32 +382,33 @@ class ParametrizedMixin(LazyMixin):
         :type name: str
         :return: the type registered
         """
-        for p in cls.registered_parameters():
-            if p['name'] == name:
-                return p['type']
-        return None
+        return _parameter_index(cls).get(name, {}).get('type')
 
     @classmethod
     def df_registered_parameters(cls, section=None):
-        from pandas import DataFrame
-        df = DataFrame(cls.registered_parameters())
-        if section is None:
+        """
+        Get the registered parameters as a DataFrame. The frame is built once per class and shared, so treat it as
+        read only.
+        :param section: only keep parameters of this section
+        :type section: str
+        :return: DataFrame
+        """
+        df = cls._df_cache.get(cls.__name__)
+        if df is None:
+            df = _pandas().DataFrame(cls.registered_parameters())
+            cls._df_cache[cls.__name__] = df
+        if section is None or df.empty:
             return df
         else:
-            return df.query('section=="{}"'.format(section))
+            return df.loc[df['section'] == section]
 
     @classmethod
     def json_registered_parameters(cls, section=None):
-        from pandas import DataFrame
-        df = DataFrame(cls.registered_parameters())
+        df = cls.df_registered_parameters(section)
         if df.empty:
             return '[]'
 
-        df = df[['section', 'name', 'description', 'default']]
-        if section is None:
-            return df.to_json(orient='records')
-        else:
-            return df.query('section=="{}"'.format(section)).to_json(orient='records')
+        return df[['section', 'name', 'description', 'default']].to_json(orient='records')
 
     @classmethod
     def markup_registered_parameters(cls, section=None):
@@ -227,14 +416,20 @@ class ParametrizedMixin(LazyMixin):
         if rp is None or len(rp) == 0:
             return "[]"
 
-        html = "<table width=90%><tr><th>Section</th><th>Name</th><th>Default</th><th>Description</th></tr>"
-        for row in rp:
-            if section is None or row['section'] == section:
-                html += "<tr><td>{}&nbsp;&nbsp;&nbsp;</td><td>{}&nbsp;&nbsp;&nbsp;</td><td>{}&nbsp;&nbsp;&nbsp;</td>" \
-                        "<td>{}&nbsp;&nbsp;&nbsp;</td></tr>"\
-                    .format(row['section'], row['name'], row['default'], row['description'])
-        html += "</table>"
-        return html
+        if section is None:
+            html = cls._markup_cache.get(cls.__name__)
+            if html is None:
+                html = cls._markup_cache[cls.__name__] = cls._markup_table(rp)
+            return html
+        return cls._markup_table(row for row in rp if row['section'] == section)
+
+    @staticmethod
+    def _markup_table(rows):
+        return "<table width=90%><tr><th>Section</th><th>Name</th><th>Default</th><th>Description</th></tr>" + \
+            "".join("<tr><td>{}&nbsp;&nbsp;&nbsp;</td><td>{}&nbsp;&nbsp;&nbsp;</td><td>{}&nbsp;&nbsp;&nbsp;</td>"
+                    "<td>{}&nbsp;&nbsp;&nbsp;</td></tr>"
+                    .format(row['section'], row['name'], row['default'], row['description']) for row in rows) + \
+            "</table>"
 
     def get(self, name, default=None):
         """
@@ -244,7 +439,10 @@ class ParametrizedMixin(LazyMixin):
         :param default: a given overridden default value
         :return: the value
         """
-        return self.parameters.get(name, default or self.parameter_default(name))
+        params = self.parameters
+        if name in params:
+            return params[name]
+        return default if default is not None else self.parameter_default(name)
 
     def set(self, name, value):
         """
@@ -254,22 +452,65 @@ class ParametrizedMixin(LazyMixin):
         :param value: the value to set
         :return: self
         """
-        registered_type = self.parameter_type(name)
-        if registered_type is None:
-            msg = 'Parameter {} is not registered for class {}'.format(name, self.__class__.__name__)
-            logger.error(msg)
-            logger.debug(traceback.format_exc())
-            raise ValueError(msg)
-        if not isinstance(value, registered_type) and not isinstance(registered_type, type(None)):
-            msg = 'The value {} is not the same type as registered {}'.format(value, registered_type)
-            logger.error(msg)
-            logger.debug(traceback.format_exc())
-            raise ValueError(msg)
-        self.parameters[name] = value
-        self.invalidate(name)
-        self.params = self.parameters
+        return self.bulk_set({name: value})
+
+    def bulk_set(self, values):
+        """
+        Set the values for several parameters. All values are checked before any is written, and they are written
+        together, with a single JSON_SET or a single change notification.
+        :param values: the values to set, keyed by parameter name
+        :type values: dict
+        :return: self
+        """
+        for name, value in values.items():
+            registered_type = self.parameter_type(name)
+            if registered_type is None:
+                msg = 'Parameter {} is not registered for class {}'.format(name, self.__class__.__name__)
+                logger.error(msg)
+                logger.debug(traceback.format_exc())
+                raise ValueError(msg)
+            if not isinstance(value, registered_type) and not isinstance(registered_type, type(None)):
+                msg = 'The value {} is not the same type as registered {}'.format(value, registered_type)
+                logger.error(msg)
+                logger.debug(traceback.format_exc())
+                raise ValueError(msg)
+        if values:
+            self._write_parameters(values)
         return self
 
+    def _write_parameters(self, values):
+        """
+        Write parameter values. When the row is persisted and already has parameters, only the given paths are
+        sent to mysql with JSON_SET, and the loaded params are updated without marking the column as modified, so
+        the next flush does not serialize the whole column again. Otherwise params is updated in memory.
+
+        The JSON_SET update bypasses the unit of work, so mapper events such as before_update do not see it. Classes
+        with before_update listeners, e.g. validators, always take the in-memory path so their listeners still run.
+        :param values: parameter values keyed by name
+        :type values: dict
+        """
+        params = self.parameters
+        state = inspect(self)
+        mapper = state.mapper
+        if params and state.persistent and not mapper.dispatch.before_update \
+                and state.session.get_bind(mapper=mapper).dialect.name == 'mysql':
+            column = mapper.columns['params']
+            paths = []
+            for name, value in values.items():
+                paths += ['$."{}"'.format(name), func.json_extract(json.dumps(value), '$')]
+            criteria = [c == v for c, v in zip(mapper.primary_key, state.identity)]
+            state.session.execute(column.table.update().where(and_(*criteria))
+                                  .values({column: func.json_set(column, *paths)}))
+            dict.update(params, values)
+        else:
+            if self.params is not params:
+                # no params yet, start a tracked dict shared by the column and the lazy cache
+                params = MutableDict(params)
+                self.params = params
+                self._lazy_cache['parameters'] = params
+            params.update(values)
+            flag_modified(self, 'params')
+
 
 class Versions(db.Model):
     """
@@ -282,12 +523,14 @@ class Versions(db.Model):
       `class_name` varchar(256) NOT NULL,
       `record_name` varchar(256) NOT NULL,
       `max_version` int(11) NOT NULL,
-      PRIMARY KEY (`id`)
+      PRIMARY KEY (`id`),
+      UNIQUE KEY `ix_versions_class_record` (`class_name`, `record_name`)
     ) ENGINE=InnoDB DEFAULT CHARSET=latin1
     """
 
     tablename = 'versions'
     __tablename__ = 'versions'
+    __table_args__ = (db.Index('ix_versions_class_record', 'class_name', 'record_name', unique=True),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     class_name = Column(String(256), nullable=False)
@@ -295,10 +538,24 @@ class Versions(db.Model):
     max_version = Column(Integer, default=0, nullable=False)
 
     def current_max_version(self):
-        self.max_version = Versions.max_version + 1
-        db.session.add(self)
+        """
+        Increment the max version in one atomic UPDATE and return the new value. MySQL has no UPDATE ... RETURNING,
+        so the value is handed back through LAST_INSERT_ID(expr), which is scoped to the connection. Other backends
+        read it back in the same transaction, while the UPDATE still holds the row lock.
+        :return: the new max version
+        """
+        versions = Versions.__table__
+        increment = versions.update().where(versions.c.id == self.id)
+        if db.session.get_bind(mapper=self.__mapper__).dialect.name == 'mysql':
+            db.session.execute(increment.values(max_version=func.last_insert_id(versions.c.max_version + 1)))
+            max_version = db.session.execute(select([func.last_insert_id()])).scalar()
+        else:
+            db.session.execute(increment.values(max_version=versions.c.max_version + 1))
+            max_version = db.session.execute(select([versions.c.max_version])
+                                             .where(versions.c.id == self.id)).scalar()
         db.session.commit()
-        return self.max_version
+        set_committed_value(self, 'max_version', max_version)
+        return max_version
 
 
 class VersionedMixin(object):
@@ -313,6 +570,12 @@ class VersionedMixin(object):
     name = Column(String(250), nullable=False)
     version = Column(Integer, default=1, nullable=False)
 
+    @declared_attr
+    def __table_args__(cls):
+        if has_inherited_table(cls):
+            return None
+        return (db.Index('ix_{}_name'.format(cls.__tablename__), 'name'),)
+
     def __init__(self, name='', version=None):
         self.name = name
         if version is not None:
@@ -330,10 +593,25 @@ class VersionedMixin(object):
     def set_version(self):
         """
         Set the version of this model. We find the largest version in the database for this model name,
-        increment on top of that.
+        increment on top of that. On mysql the versions row is seeded or incremented by a single
+        INSERT ... SELECT ... ON DUPLICATE KEY UPDATE, relying on the unique (class_name, record_name) key.
         :return:
         """
         tc = self.__class__
+        if db.session.get_bind(mapper=Versions.__mapper__).dialect.name == 'mysql':
+            versions = Versions.__table__
+            # built through the ORM so single table inheritance adds its discriminator criterion
+            seed = db.session.query(literal(tc.__name__), literal(self.name),
+                                    func.coalesce(func.max(tc.version), 0) + 1)\
+                .filter(tc.name == self.name).statement
+            upsert = mysql_insert(versions).from_select(['class_name', 'record_name', 'max_version'], seed)
+            db.session.execute(upsert.on_duplicate_key_update(max_version=versions.c.max_version + 1))
+            self.version = db.session.execute(select([versions.c.max_version])
+                                              .where(and_(versions.c.class_name == tc.__name__,
+                                                          versions.c.record_name == self.name))).scalar()
+            db.session.commit()
+            return
+
         version = db.session.query(Versions).filter(Versions.class_name == tc.__name__,
                                                  Versions.record_name == self.name).first()
         if not version:
@@ -347,6 +625,49 @@ class VersionedMixin(object):
 
         self.version = version.current_max_version()
 
+    @classmethod
+    def bulk_new_version(cls, objs):
+        """
+        Turn a batch of objects into new versions. Objects are grouped by class and name, so the versions table is
+        locked, read and updated once per batch instead of once per object, and everything is committed together.
+        :param objs: the versioned objects
+        :type objs: list
+        :return: the objects, transient with their new versions set
+        """
+        groups = {}
+        for obj in objs:
+            groups.setdefault(obj.__class__, {}).setdefault(obj.name, []).append(obj)
+
+        for tc, by_name in groups.items():
+            names = list(by_name)
+            max_versions = dict(db.session.query(Versions.record_name, Versions.max_version)
+                                .filter(Versions.class_name == tc.__name__, Versions.record_name.in_(names))
+                                .with_for_update().all())
+            missing = [name for name in names if name not in max_versions]
+            if missing:
+                existing = dict(db.session.query(tc.name, func.max(tc.version))
+                                .filter(tc.name.in_(missing)).group_by(tc.name).all())
+                new_versions = [{'class_name': tc.__name__, 'record_name': name, 'max_version': existing.get(name) or 0}
+                                for name in missing]
+                db.session.bulk_insert_mappings(Versions, new_versions)
+                max_versions.update((v['record_name'], v['max_version']) for v in new_versions)
+
+            increments = Versions.__table__.update()\
+                .where(and_(Versions.class_name == bindparam('b_class_name'),
+                            Versions.record_name == bindparam('b_record_name')))\
+                .values(max_version=Versions.max_version + bindparam('b_count'))
+            db.session.execute(increments, [{'b_class_name': tc.__name__, 'b_record_name': name, 'b_count': len(group)}
+                                            for name, group in by_name.items()])
+
+            for name, group in by_name.items():
+                for i, obj in enumerate(group, 1):
+                    obj.version = max_versions[name] + i
+                    make_transient(obj)
+                    obj.id = None
+
+        db.session.commit()
+        return objs
+
     def new_version(self, **kwargs):
         self.set_version()
         make_transient(self)
@@ -0,0 +1,105 @@
+import json
+import pytest
+from flask import Flask
+from python_utils.flask_sqlalchemy_base import db, JsonDeSerMixin, AuditMixin, VersionedMixin, ParametrizedMixin, \
+    register_parameter
+
+
+@register_parameter(name='retries', default=3)
+@register_parameter(name='label', default='none', section='display')
+class Widget(db.Model, VersionedMixin, ParametrizedMixin, AuditMixin, JsonDeSerMixin):
+    __tablename__ = 'widget'
+
+    def __init__(self, name='', params=None):
+        VersionedMixin.__init__(self, name=name)
+        ParametrizedMixin.__init__(self, params)
+
+
+@pytest.fixture
+def sqlite_db():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+def test_bulk_new_version(sqlite_db):
+    sqlite_db.session.add(Widget('alpha'))
+    sqlite_db.session.commit()
+
+    widgets = Widget.bulk_new_version([Widget('alpha'), Widget('alpha'), Widget('beta')])
+    assert [w.version for w in widgets] == [2, 3, 1]
+    assert all(w.id is None for w in widgets)
+
+    sqlite_db.session.add_all(widgets)
+    sqlite_db.session.commit()
+
+    widgets = Widget.bulk_new_version([Widget('beta'), Widget('gamma')])
+    assert [w.version for w in widgets] == [2, 1]
+
+
+def test_invalidate_drops_cached_values():
+    widget = Widget(params={'retries': 1})
+    assert widget.parameters == {'retries': 1}
+
+    widget.params = {'retries': 2}
+    assert widget.parameters == {'retries': 1}
+
+    widget.invalidate('parameters')
+    assert widget.parameters == {'retries': 2}
+
+    widget.params = {'retries': 4}
+    widget.invalidate()
+    assert widget.parameters == {'retries': 4}
+
+
+def test_default_params_are_not_shared():
+    first, second = Widget(), Widget()
+    first.set('retries', 5)
+    assert first.get('retries') == 5
+    assert second.get('retries') == 3
+    assert second.params == {}
+
+
+def test_bulk_set_rejects_whole_batch():
+    widget = Widget(params={'retries': 1})
+    with pytest.raises(ValueError):
+        widget.bulk_set({'label': 'fast', 'retries': 'many'})
+    assert widget.params == {'retries': 1}
+
+
+def test_get_honours_falsy_default():
+    widget = Widget()
+    assert widget.get('retries') == 3
+    assert widget.get('retries', 0) == 0
+    assert widget.get('label', '') == ''
+
+
+def test_to_json_bytes_matches_to_json(sqlite_db):
+    widgets = [Widget('alpha', params={'retries': 1}), Widget('beta')]
+    sqlite_db.session.add_all(widgets)
+    sqlite_db.session.commit()
+
+    assert json.loads(widgets[0].to_json_bytes().decode()) == widgets[0].to_json()
+    assert json.loads(Widget.bulk_to_json_bytes(widgets).decode()) == [w.to_json() for w in widgets]
+
+
+def test_json_upserts_fall_back_to_the_session(sqlite_db):
+    widget = Widget('alpha')
+    sqlite_db.session.add(widget)
+    sqlite_db.session.commit()
+
+    assert Widget.bulk_from_json([{'id': widget.id, 'name': 'renamed'}, {'name': 'beta', 'version': 1}])
+    assert sqlite_db.session.query(Widget).get(widget.id).name == 'renamed'
+    beta = sqlite_db.session.query(Widget).filter_by(name='beta').one()
+    assert beta.version == 1
+
+    assert beta.from_json({'params': {'retries': 7}})
+    sqlite_db.session.expire_all()
+    assert sqlite_db.session.query(Widget).get(beta.id).get('retries') == 7
+    assert sqlite_db.session.query(Widget).count() == 2